@@ -7,8 +7,10 @@ from airflow.sdk import asset, Asset, Context
 def user(self) -> dict[str]:
     import requests
 
-    r = requests.get(self.uri)
-    return r.json()
+    r = requests.get(self.uri, timeout=10)
+    result = r.json()["results"][0]
+    # only keep what user_info needs so downstream pulls a small xcom
+    return {"location": result["location"], "login": result["login"]}
 
 
 # don't need to call it explicitly like a dag
@@ -29,7 +31,7 @@ def user_info(user: Asset, context: Context) -> list[dict[str]]:
     )
      
     return [
-         user_data['results'][0]['location'], 
-         user_data['results'][0]['login']
+         user_data['location'], 
+         user_data['login']
     ]
 # fmt: on
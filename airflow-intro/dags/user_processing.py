@@ -1,15 +1,18 @@
+from datetime import datetime
+
+import requests
+
 from airflow.sdk import dag, task
 from airflow.providers.common.sql.operators.sql import SQLExecuteQueryOperator
 
 # sensors check if something is true (if API is availible for example), true means sucess
 from airflow.sdk.bases.sensor import PokeReturnValue
 
-# extract data with python
-from airflow.providers.standard.operators.python import PythonOperator
-
 # postgres hook
 from airflow.providers.postgres.hooks.postgres import PostgresHook
 
+FAKE_USER_URL = "https://raw.githubusercontent.com/marclamberti/datasets/refs/heads/main/fakeuser.json"
+
 
 @dag
 def user_processing():
@@ -19,10 +22,21 @@ def user_processing():
     #     hook = PostgresHook(postgres_conn_id="postgres")
     #     hook.run("truncate table users")
 
+    # only let create_table run the first time - once the table exists the
+    # ddl is skipped instead of re-run (and re-locking the catalog) every run
+    @task.short_circuit(
+        ignore_downstream_trigger_rules=False, pool="postgres_pool", pool_slots=1
+    )
+    def need_table():
+        hook = PostgresHook(postgres_conn_id="postgres")
+        return hook.get_first("select to_regclass('public.users') is null")[0]
+
     # making variable
     create_table = SQLExecuteQueryOperator(  # interacts with sql database
         task_id="create_table",  # what you see in airflow UI
         conn_id="postgres",
+        pool="postgres_pool",  # shared with load_user to bound db connections
+        pool_slots=1,
         sql=""" 
         create table if not exists users (
             id INT PRIMARY KEY, 
@@ -34,13 +48,19 @@ def user_processing():
     )
 
     # checking condition, 300 is 5 minutes
-    @task.sensor(poke_interval=5, timeout=300)
+    # reschedule mode gives the worker slot back between pokes
+    # none_failed so a skipped create_table doesn't skip the rest of the run
+    @task.sensor(
+        poke_interval=30,
+        timeout=300,
+        mode="reschedule",
+        exponential_backoff=True,
+        trigger_rule="none_failed",
+    )
     def is_api_availible() -> PokeReturnValue:
-        import requests
-
-        response = requests.get(
-            "https://raw.githubusercontent.com/marclamberti/datasets/refs/heads/main/fakeuser.json"
-        )
+        # plain GET with a timeout - every poke is its own process in reschedule
+        # mode and the run ends on the first 200, so there is nothing to cache
+        response = requests.get(FAKE_USER_URL, timeout=(3, 10))
         print(response.status_code)
         if response.status_code == 200:
             condition = True
@@ -59,35 +79,24 @@ def user_processing():
             "email": fake_user["personalInfo"]["email"],
         }
 
-    @task
-    def process_user(user_info):
-        import csv
-        from datetime import datetime
-
+    # process + store in one task: a single row goes in as a plain INSERT,
+    # no CSV formatting or COPY round-trip needed
+    @task(pool="postgres_pool", pool_slots=1)
+    def load_user(user_info):
         user_info["created_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        with open("/tmp/user_info.csv", "w", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=user_info.keys())
-            writer.writeheader()
-            writer.writerow(user_info)
-
-    @task
-    def store_user():
-        # if os.path.exists("/tmp/user_info.csv"):
-        #     os.remove("/tmp/user_info.csv")
         hook = PostgresHook(postgres_conn_id="postgres")
-        # fmt: off
-        hook.copy_expert(
-            sql="copy users from stdin with csv header", 
-            filename="/tmp/user_info.csv"
+        hook.insert_rows(
+            "users",
+            rows=[tuple(user_info.values())],
+            target_fields=list(user_info.keys()),
         )
-        # fmt: on
 
-    process_user(extract_user(create_table >> is_api_availible())) >> store_user()
+    load_user(extract_user(need_table() >> create_table >> is_api_availible()))
+    # need_table >> create_table
     # create_table >> is_api_availible
     # is_api_availible >> extract_user
-    # extract_user >> process_user
-    # process_user >> store_user
+    # extract_user >> load_user
 
 
 # need to call or else you wont' see it on airflow UI
@@ -16,8 +16,17 @@ from airflow.providers.standard.operators.python import PythonOperator  # type:
 from airflow.providers.standard.operators.bash import BashOperator  # type: ignore
 from airflow.providers.smtp.operators.smtp import EmailOperator  # type: ignore
 from airflow.providers.standard.sensors.filesystem import FileSensor  # type: ignore
+import numpy as np
 import pandas as pd
 import logging
+import os
+
+# Known product -> category mapping; anything not listed is 'Other'
+PRODUCT_CATEGORY = {
+    'Widget A': 'Electronics',
+    'Widget B': 'Electronics',
+    'Widget C': 'Electronics',
+}
 
 # Default arguments that apply to all tasks in the DAG
 # These are best practices for production DAGs
@@ -43,7 +52,17 @@ dag = DAG(
     tags=['sales', 'reporting', 'daily'],  # Tags help organize DAGs in UI
 )
 
-def extract_sales_data(**context):
+def run_dir(context):
+    """
+    Per-run scratch directory under /tmp
+    
+    Keyed on run_id so concurrent runs never write to the same files.
+    """
+    path = f"/tmp/{context['run_id']}"
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def extract_sales_data(context):
     """
     Extract sales data from source system
     
@@ -53,7 +72,7 @@ def extract_sales_data(**context):
     - Cloud storage (S3, GCS)
     - SaaS platforms (Salesforce, Shopify)
     
-    **context contains runtime information like execution_date
+    context contains runtime information like execution_date
     """
     # Simulate data extraction - in reality you'd use database connectors
     execution_date = context['execution_date']
@@ -62,28 +81,27 @@ def extract_sales_data(**context):
     # This would be actual database query in production:
     # import psycopg2
     # conn = psycopg2.connect(database="sales", user="user", password="pass")
-    # df = pd.read_sql("SELECT * FROM sales WHERE date = %s", conn, params=[execution_date])
+    # df = pd.read_sql("SELECT * FROM sales WHERE date = %s", conn, params=[execution_date],
+    #                  dtype_backend='pyarrow')
     
     # For demo purposes, create sample data
-    sample_data = {
-        'order_id': [1001, 1002, 1003, 1004, 1005],
-        'customer_id': [501, 502, 503, 504, 505],
-        'product': ['Widget A', 'Widget B', 'Widget A', 'Widget C', 'Widget B'],
-        'quantity': [2, 1, 3, 1, 2],
-        'price': [29.99, 49.99, 29.99, 19.99, 49.99],
-        'order_date': [execution_date.date()] * 5
-    }
-    
-    df = pd.DataFrame(sample_data)
-    
-    # Save to temporary location for next task
-    # In production, you might use XCom, database, or shared storage
-    df.to_csv('/tmp/raw_sales_data.csv', index=False)
+    # Columns are built already typed (narrowest dtype that fits the source
+    # schema) so pandas doesn't have to infer them or copy on a later astype.
+    # price stays float64: float32 can't hold cent values closely enough and
+    # the error would show up in total_amount and the report
+    df = pd.DataFrame({
+        'order_id': np.array([1001, 1002, 1003, 1004, 1005], dtype='uint32'),
+        'customer_id': np.array([501, 502, 503, 504, 505], dtype='uint32'),
+        'product': pd.array(['Widget A', 'Widget B', 'Widget A', 'Widget C', 'Widget B'], dtype='string[pyarrow]'),
+        'quantity': np.array([2, 1, 3, 1, 2], dtype='int16'),
+        'price': np.array([29.99, 49.99, 29.99, 19.99, 49.99], dtype='float64'),
+        'order_date': pd.array([execution_date.date()] * 5, dtype='date32[pyarrow]'),
+    })
     logging.info(f"Extracted {len(df)} sales records")
     
-    return f"Extracted {len(df)} records"
+    return df
 
-def transform_sales_data(**context):
+def transform_sales_data(df):
     """
     Clean and transform the raw sales data
     
@@ -95,15 +113,17 @@ def transform_sales_data(**context):
     """
     logging.info("Starting data transformation")
     
-    # Read the raw data from previous task
-    df = pd.read_csv('/tmp/raw_sales_data.csv')
-    
     # Add calculated fields (common in business reporting)
     df['total_amount'] = df['quantity'] * df['price']
     df['order_date'] = pd.to_datetime(df['order_date'])
     
     # Add business categorization
-    df['product_category'] = df['product'].apply(lambda x: 'Electronics' if 'Widget' in x else 'Other')
+    # As a categorical, the lookup runs once per distinct product, not per row:
+    # map each category, then index that result with the row codes. The extra
+    # trailing 'Other' is what a null product's -1 code picks up
+    df['product'] = df['product'].astype('category')
+    categories = [PRODUCT_CATEGORY.get(p, 'Other') for p in df['product'].cat.categories]
+    df['product_category'] = pd.Categorical(categories + ['Other']).take(df['product'].cat.codes)
     
     # Data quality checks (critical in production)
     if df['total_amount'].sum() == 0:
@@ -111,17 +131,15 @@ def transform_sales_data(**context):
     
     if df.isnull().any().any():
         logging.warning("Found null values in data")
-        df = df.fillna(0)  # Handle nulls appropriately
-    
-    # Save transformed data
-    df.to_csv('/tmp/transformed_sales_data.csv', index=False)
+        # Only the numeric columns - 0 isn't a valid category for product
+        df = df.fillna({'quantity': 0, 'price': 0, 'total_amount': 0})
     
     total_revenue = df['total_amount'].sum()
     logging.info(f"Transformation complete. Total revenue: ${total_revenue:.2f}")
     
-    return f"Processed {len(df)} records, total revenue: ${total_revenue:.2f}"
+    return df
 
-def generate_sales_report(**context):
+def generate_sales_report(df, context):
     """
     Generate business reports and summaries
     
@@ -132,16 +150,17 @@ def generate_sales_report(**context):
     """
     logging.info("Generating sales report")
     
-    df = pd.read_csv('/tmp/transformed_sales_data.csv')
-    
     # Generate summary statistics (what executives want to see)
+    # sort=False skips sorting the group keys - we only need the argmax
+    quantity_by_product = df.groupby('product', sort=False, observed=True)['quantity'].sum()
+    revenue = df['total_amount'].agg(['sum', 'mean'])
     report = {
         'date': context['execution_date'].strftime('%Y-%m-%d'),
         'total_orders': len(df),
-        'total_revenue': df['total_amount'].sum(),
-        'average_order_value': df['total_amount'].mean(),
-        'top_product': df.groupby('product')['quantity'].sum().idxmax(),
-        'unique_customers': df['customer_id'].nunique()
+        'total_revenue': float(revenue['sum']),
+        'average_order_value': float(revenue['mean']),
+        'top_product': quantity_by_product.idxmax(),
+        'unique_customers': int(df['customer_id'].nunique())
     }
     
     # In production, you might:
@@ -152,13 +171,13 @@ def generate_sales_report(**context):
     
     # For demo, save as JSON
     import json
-    with open('/tmp/sales_report.json', 'w') as f:
+    with open(f"{run_dir(context)}/sales_report.json", 'w') as f:
         json.dump(report, f, indent=2, default=str)
     
     logging.info(f"Report generated: {report}")
     return report
 
-def validate_data_quality(**context):
+def validate_data_quality(df):
     """
     Data quality validation - crucial for production pipelines
     
@@ -168,8 +187,6 @@ def validate_data_quality(**context):
     - Data freshness validation
     - Schema validation
     """
-    df = pd.read_csv('/tmp/transformed_sales_data.csv')
-    
     # Business rule validations
     if len(df) == 0:
         raise ValueError("No data processed - pipeline failure")
@@ -185,41 +202,48 @@ def validate_data_quality(**context):
     logging.info("Data quality validation passed")
     return "Data quality OK"
 
+def run_sales_etl(**context):
+    """
+    Run extract -> transform -> validate -> report as one task
+    
+    The DataFrame stays in memory between the steps, so there is no
+    file write/read or task startup between them. Only the transformed
+    data (for the backup task) and the report are written out.
+    """
+    df = extract_sales_data(context)
+    df = transform_sales_data(df)
+    validate_data_quality(df)
+    
+    # Save transformed data
+    df.to_parquet(f"{run_dir(context)}/transformed_sales_data.parquet", engine='pyarrow', compression='zstd')
+    
+    return generate_sales_report(df, context)
+
 # Define tasks using the functions above
 # Each task runs independently and can be parallelized where possible
 
-extract_task = PythonOperator(
-    task_id='extract_sales_data',  # Unique task identifier
-    python_callable=extract_sales_data,  # Function to execute
+etl_task = PythonOperator(
+    task_id='run_sales_etl',  # Unique task identifier
+    python_callable=run_sales_etl,  # Function to execute
     dag=dag,
     # You can add task-specific overrides here:
+    retry_exponential_backoff=True,  # Back off instead of retrying on a fixed 5 min beat
+    max_retry_delay=timedelta(minutes=30),
     # retries=3,  # This task might need more retries
     # pool='database_pool',  # Limit concurrent database connections
 )
 
-transform_task = PythonOperator(
-    task_id='transform_sales_data',
-    python_callable=transform_sales_data,
-    dag=dag,
-)
-
-report_task = PythonOperator(
-    task_id='generate_sales_report',
-    python_callable=generate_sales_report,
-    dag=dag,
-)
-
-validate_task = PythonOperator(
-    task_id='validate_data_quality',
-    python_callable=validate_data_quality,
-    dag=dag,
-)
-
 # Example of using BashOperator for system commands
 # This is useful for calling external scripts or system utilities
+# The backup is named after the run too, so two runs on the same day don't
+# overwrite each other; the run's scratch directory is removed afterwards
+# (the report itself is still in run_sales_etl's XCom)
 backup_task = BashOperator(
     task_id='backup_processed_data',
-    bash_command='cp /tmp/transformed_sales_data.csv /tmp/backup_$(date +%Y%m%d).csv',
+    bash_command=(
+        'cp "/tmp/{{ run_id }}/transformed_sales_data.parquet" "/tmp/backup_{{ ds_nodash }}_{{ run_id }}.parquet"'
+        ' && rm -rf "/tmp/{{ run_id }}"'
+    ),
     dag=dag,
 )
 
@@ -230,6 +254,8 @@ file_sensor = FileSensor(
     filepath='/tmp/external_trigger.txt',  # File to wait for
     timeout=300,  # Maximum wait time (5 minutes)
     poke_interval=30,  # Check every 30 seconds
+    mode='reschedule',  # Free the worker slot between checks
+    retries=0,  # A timeout already means the file never came - don't wait again
     dag=dag,
     # In production, you might wait for files like:
     # - Daily exports from other systems
@@ -249,6 +275,7 @@ notify_task = EmailOperator(
     <p>The daily sales data pipeline has completed processing.</p>
     <p>Check the dashboard for updated reports.</p>
     """,
+    retries=0,  # A retry could send the same email twice
     dag=dag,
 )
 
@@ -256,29 +283,21 @@ notify_task = EmailOperator(
 # This creates a Directed Acyclic Graph (DAG)
 
 # Option 1: Using >> operator (most readable)
-extract_task >> transform_task >> validate_task >> report_task
-extract_task >> backup_task  # Backup can run in parallel with transform
+etl_task >> backup_task  # Backup only needs the transformed file
+[etl_task, file_sensor] >> notify_task  # Sensor waits while the ETL runs
 
 # Option 2: You could also use set_downstream/set_upstream methods
-# extract_task.set_downstream(transform_task)
+# etl_task.set_downstream(notify_task)
 
 # Option 3: For more complex dependencies, you can use lists
-# [extract_task, file_sensor] >> transform_task >> [validate_task, backup_task] >> report_task >> notify_task
+# (used above to let file_sensor and etl_task run side by side)
 
 # The final dependency chain shows how tasks flow:
-# extract_task (start)
-#   ↓
-# transform_task 
-#   ↓
-# validate_task
-#   ↓  
-# report_task
-#   ↓
-# notify_task (end)
+# etl_task (extract -> transform -> validate -> report)   file_sensor
+#   ↓                                                        ↓
+# notify_task (end, once both are done) ←────────────────────┘
 #
-# backup_task runs in parallel after extract_task
-
-report_task >> notify_task
+# backup_task runs in parallel with notify_task after etl_task
 
 # Additional production considerations not shown in this example:
 # 
@@ -0,0 +1,8 @@
+-- Migration: drop customer_order_sequence from transformed_sales_data
+-- Run this once in BigQuery console or via bq CLI on datasets created before
+-- the transform stopped computing the column:
+--   bq query --use_legacy_sql=false < drop_customer_order_sequence.sql
+-- Not needed after a fresh setup_tables.sql, which no longer defines it
+
+ALTER TABLE `sales_pipeline.transformed_sales_data`
+DROP COLUMN IF EXISTS customer_order_sequence;
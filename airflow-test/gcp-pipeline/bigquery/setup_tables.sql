@@ -51,9 +51,6 @@ CREATE OR REPLACE TABLE `sales_pipeline.transformed_sales_data` (
   month INT64,
   quarter INT64,
   
-  -- Customer analytics
-  customer_order_sequence INT64,
-  
   -- Financial calculations
   revenue FLOAT64,
   estimated_profit FLOAT64,
@@ -66,7 +63,8 @@ PARTITION BY order_date
 CLUSTER BY region, product_category
 OPTIONS (
   description = "Transformed and enriched sales data",
-  partition_expiration_days = 365
+  partition_expiration_days = 365,
+  require_partition_filter = TRUE  -- Reject queries that would scan every partition
 );
 
 -- Daily summary table for reporting
@@ -30,6 +30,7 @@ echo "🔧 Enabling required APIs..."
 gcloud services enable cloudfunctions.googleapis.com
 gcloud services enable workflows.googleapis.com  
 gcloud services enable bigquery.googleapis.com
+gcloud services enable bigquerystorage.googleapis.com
 gcloud services enable storage.googleapis.com
 gcloud services enable cloudscheduler.googleapis.com
 
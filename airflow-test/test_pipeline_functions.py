@@ -4,6 +4,7 @@ Test script for pipeline functions without Airflow
 Run this to see what the data processing logic actually does
 """
 
+import numpy as np
 import pandas as pd
 import logging
 from datetime import datetime, date
@@ -23,11 +24,13 @@ def extract_sales_data(**context):
         'product': ['Widget A', 'Widget B', 'Widget A', 'Widget C', 'Widget B'],
         'quantity': [2, 1, 3, 1, 2],
         'price': [29.99, 49.99, 29.99, 19.99, 49.99],
-        'order_date': [execution_date.date()] * 5
+        'order_date': [pd.Timestamp(execution_date.date())] * 5
     }
     
     df = pd.DataFrame(sample_data)
-    df.to_csv('/tmp/raw_sales_data.csv', index=False)
+    # Categorical product -> groupby hashes small int codes, not strings
+    df['product'] = df['product'].astype('category')
+    df.to_parquet('/tmp/raw_sales_data.parquet', engine='pyarrow', compression='snappy')
     logging.info(f"Extracted {len(df)} sales records")
     return f"Extracted {len(df)} records"
 
@@ -35,15 +38,16 @@ def transform_sales_data(**context):
     """Transform sales data - copied from DAG"""
     logging.info("Starting data transformation")
     
-    df = pd.read_csv('/tmp/raw_sales_data.csv')
-    df['total_amount'] = df['quantity'] * df['price']
-    df['order_date'] = pd.to_datetime(df['order_date'])
-    df['product_category'] = df['product'].apply(lambda x: 'Electronics' if 'Widget' in x else 'Other')
+    # Parquet keeps the dtypes, so order_date comes back as datetime64 already
+    df = pd.read_parquet('/tmp/raw_sales_data.parquet')
+    df['total_amount'] = df['quantity'].to_numpy() * df['price'].to_numpy()
+    is_widget = df['product'].str.contains('Widget', regex=False, na=False)
+    df['product_category'] = np.where(is_widget, 'Electronics', 'Other')
     
     if df['total_amount'].sum() == 0:
         raise ValueError("No sales data found")
     
-    df.to_csv('/tmp/transformed_sales_data.csv', index=False)
+    df.to_parquet('/tmp/transformed_sales_data.parquet', engine='pyarrow', compression='snappy')
     total_revenue = df['total_amount'].sum()
     logging.info(f"Transformation complete. Total revenue: ${total_revenue:.2f}")
     return f"Processed {len(df)} records, total revenue: ${total_revenue:.2f}"
@@ -52,15 +56,17 @@ def generate_sales_report(**context):
     """Generate sales report - copied from DAG"""
     logging.info("Generating sales report")
     
-    df = pd.read_csv('/tmp/transformed_sales_data.csv')
+    df = pd.read_parquet('/tmp/transformed_sales_data.parquet')
     
+    revenue = df['total_amount'].agg(['sum', 'mean'])
+    quantity_by_product = df.groupby('product', sort=False, observed=True)['quantity'].sum()
     report = {
         'date': context.get('execution_date', datetime.now()).strftime('%Y-%m-%d'),
         'total_orders': len(df),
-        'total_revenue': df['total_amount'].sum(),
-        'average_order_value': df['total_amount'].mean(),
-        'top_product': df.groupby('product')['quantity'].sum().idxmax(),
-        'unique_customers': df['customer_id'].nunique()
+        'total_revenue': float(revenue['sum']),
+        'average_order_value': float(revenue['mean']),
+        'top_product': quantity_by_product.idxmax(),
+        'unique_customers': int(df['customer_id'].nunique())
     }
     
     with open('/tmp/sales_report.json', 'w') as f:
@@ -92,7 +98,7 @@ if __name__ == "__main__":
         
         print("\n4. Checking generated files...")
         import os
-        files = ['/tmp/raw_sales_data.csv', '/tmp/transformed_sales_data.csv', '/tmp/sales_report.json']
+        files = ['/tmp/raw_sales_data.parquet', '/tmp/transformed_sales_data.parquet', '/tmp/sales_report.json']
         for file in files:
             if os.path.exists(file):
                 print(f"   ✅ {file} created")
@@ -101,8 +107,8 @@ if __name__ == "__main__":
         
         print("\n🎉 Pipeline test completed successfully!")
         print("\nGenerated files:")
-        print("- /tmp/raw_sales_data.csv")
-        print("- /tmp/transformed_sales_data.csv") 
+        print("- /tmp/raw_sales_data.parquet")
+        print("- /tmp/transformed_sales_data.parquet") 
         print("- /tmp/sales_report.json")
         
     except Exception as e: